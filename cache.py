@@ -0,0 +1,131 @@
+"""Persistent records kept between runs: models that have already been uploaded, and licenses of source models."""
+
+# ───────────────────────────────────────────────────── imports ────────────────────────────────────────────────────── #
+import atexit
+import os
+import threading
+import time
+from pathlib import Path
+
+import orjson
+from loguru import logger
+
+CACHE_FILE = Path("upload_cache.json")
+LICENSE_CACHE_FILE = Path(os.getenv("XDG_CACHE_HOME", Path.home() / ".cache")) / "auto-cloner" / "licenses.json"
+LICENSE_CACHE_TTL = 24 * 60 * 60  # Licenses of published repos rarely change, refresh them once a day
+
+
+def load_cache(cache_file: Path = CACHE_FILE) -> dict:
+    """Load the upload cache from disk.
+
+    Args:
+        cache_file (Path, optional): location of the cache. Defaults to CACHE_FILE.
+
+    Returns:
+        dict: cache entries keyed by source repo name, empty if there is no usable cache yet
+    """
+    try:
+        return orjson.loads(cache_file.read_bytes())
+    except FileNotFoundError:
+        return {}
+    except (OSError, orjson.JSONDecodeError) as e:
+        logger.warning(f"Ignoring unreadable cache {cache_file}: {e}")
+        return {}
+
+
+def save_cache(cache: dict, cache_file: Path = CACHE_FILE) -> None:
+    """Write the upload cache to disk atomically.
+
+    The cache is written to a temporary file first and then moved over the old one, so an interrupted write
+    never leaves a truncated cache behind.
+
+    Args:
+        cache (dict): cache entries keyed by source repo name
+        cache_file (Path, optional): location of the cache. Defaults to CACHE_FILE.
+    """
+    cache_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = cache_file.with_name(cache_file.name + ".tmp")
+    tmp_file.write_bytes(orjson.dumps(cache, option=orjson.OPT_INDENT_2))
+    os.replace(tmp_file, cache_file)
+
+
+class CacheWriter:
+    """Upload cache held in memory and written back to disk in batches.
+
+    The cache is flushed once `flush_every` entries have changed, and again when the interpreter exits.
+    It can be updated from several threads.
+
+    Args:
+        cache_file (Path, optional): location of the cache. Defaults to CACHE_FILE.
+        flush_every (int, optional): number of changed entries that triggers a write. Defaults to 16.
+    """
+
+    def __init__(self, cache_file: Path = CACHE_FILE, flush_every: int = 16) -> None:
+        self.cache_file = cache_file
+        self.flush_every = flush_every
+        self.entries = load_cache(cache_file)
+        self._dirty = 0
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def get(self, repo_name: str, default: dict | None = None) -> dict | None:
+        """Return the entry recorded for a repo, or `default` if there is none."""
+        return self.entries.get(repo_name, default)
+
+    def set(self, repo_name: str, entry: dict) -> None:
+        """Record the entry for a repo, flushing to disk if enough entries have changed."""
+        with self._lock:
+            self.entries[repo_name] = entry
+            self._dirty += 1
+            if self._dirty >= self.flush_every:
+                self._flush()
+
+    def flush(self) -> None:
+        """Write pending changes to disk."""
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._dirty:
+            save_cache(self.entries, self.cache_file)
+            self._dirty = 0
+
+
+class LicenseCache(CacheWriter):
+    """Licenses of source repos, shared between runs and refreshed once they are older than `ttl` seconds.
+
+    A `.last_sync` marker next to the cache records when licenses were last fetched from the Hub.
+
+    Args:
+        cache_file (Path, optional): location of the cache. Defaults to LICENSE_CACHE_FILE.
+        ttl (float, optional): age in seconds after which a license is fetched again. Defaults to LICENSE_CACHE_TTL.
+    """
+
+    def __init__(self, cache_file: Path = LICENSE_CACHE_FILE, ttl: float = LICENSE_CACHE_TTL) -> None:
+        super().__init__(cache_file)
+        self.ttl = ttl
+
+    def lookup(self, repo_name: str, allow_stale: bool = False) -> tuple[bool, str | None]:
+        """Look up the cached license of a repo.
+
+        Args:
+            repo_name (str): model name / repo name
+            allow_stale (bool, optional): also accept licenses older than the ttl. Defaults to False.
+
+        Returns:
+            tuple[bool, str | None]: whether a usable entry was found, and the license it records (None if the repo
+            has no license information)
+        """
+        entry = self.get(repo_name)
+        if entry is None or (not allow_stale and time.time() - entry["ts"] >= self.ttl):
+            return False, None
+        return True, entry["license"]
+
+    def store(self, repo_name: str, license: str | None) -> None:
+        """Record the license just fetched for a repo."""
+        self.set(repo_name, {"license": license, "ts": time.time()})
+
+    def _flush(self) -> None:
+        if self._dirty:
+            super()._flush()
+            (self.cache_file.parent / ".last_sync").touch()
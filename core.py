@@ -0,0 +1,541 @@
+"""Shared pipeline copying models from the Hugging Face Hub into an organization."""
+
+import atexit
+import contextlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from loguru import logger
+from cache import CacheWriter, LicenseCache
+from utils import (
+    DOWNLOAD_WORKERS,
+    UPLOAD_WORKERS,
+    RepositoryNotFoundError,
+    api,
+    download_from_hf,
+    get_streamed_size,
+    get_transfer_manifest,
+    log_hash_backend,
+    log_transfer_backend,
+    push_to_hub,
+    retry,
+    stream_to_hub,
+)
+import asyncio
+from requests.exceptions import HTTPError
+
+MAX_CONCURRENT_DOWNLOADS = 8  # Upper bound on models being transferred at the same time
+MAX_CONCURRENT_METADATA_REQUESTS = 8  # Upper bound on model size lookups in flight
+SPACE_RECHECK_INTERVAL = 10  # Seconds between disk space checks while no download finishes
+MAX_CONCURRENT_HUB_REQUESTS = 16  # Upper bound on Hugging Face Hub API calls in flight
+# Worker threads running blocking calls: the streaming downloads and uploads of every active model, and the hub calls
+THREAD_POOL_SIZE = MAX_CONCURRENT_DOWNLOADS * (DOWNLOAD_WORKERS + UPLOAD_WORKERS) + MAX_CONCURRENT_HUB_REQUESTS
+TOTAL_SPACE_TO_USE = 900  # The total space the script can use (900GB)
+MIN_FREE_SPACE = 100  # Leave 100GB free at all times
+# Upload each file as soon as it is downloaded instead of downloading the whole model first
+STREAM_UPLOADS = os.getenv("AUTO_CLONER_STREAM", "1") != "0"
+
+def get_patterns_from_env(name: str) -> list | None:
+    """
+    Reads a comma separated list of glob patterns from the environment, or None if the variable is not set.
+    """
+    value = os.getenv(name)
+    return [pattern.strip() for pattern in value.split(",") if pattern.strip()] if value else None
+
+# Optional filters on the files copied from each repo, ex. AUTO_CLONER_IGNORE_PATTERNS="*.bin,*.gguf"
+ALLOW_PATTERNS = get_patterns_from_env("AUTO_CLONER_ALLOW_PATTERNS")
+IGNORE_PATTERNS = get_patterns_from_env("AUTO_CLONER_IGNORE_PATTERNS")
+
+# Deletes local model copies off the critical path; pending deletions are finished before exiting
+_cleanup_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cleanup")
+atexit.register(_cleanup_executor.shutdown, wait=True)
+
+MODEL_INFO_TTL = 600  # Seconds a model_info response is reused before being fetched again
+_model_info_cache = {}  # (repo_name, token) -> (fetch time, model info)
+_model_info_lock = threading.Lock()  # Responses are stored from worker threads and dropped from the event loop
+
+def cached_model_info(repo_name: str, token: str):
+    """
+    Returns api.model_info for the repo, reusing responses fetched within the last MODEL_INFO_TTL seconds.
+    The files metadata is always requested, so a single response serves the license, size and file checks.
+    """
+    key = (repo_name, token)
+    with _model_info_lock:
+        cached = _model_info_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < MODEL_INFO_TTL:
+        return cached[1]
+    model_info = retry()(api.model_info)(repo_name, token=token, files_metadata=True)
+    with _model_info_lock:
+        _model_info_cache[key] = (time.monotonic(), model_info)
+    return model_info
+
+def invalidate_model_info(repo_name: str) -> None:
+    """
+    Drops every cached model_info response for the repo, ex. after it has been modified.
+    """
+    with _model_info_lock:
+        for key in [key for key in _model_info_cache if key[0] == repo_name]:
+            del _model_info_cache[key]
+
+# Only rely on licenses cached by previous runs, ex. when the Hub can't be reached
+REMOTE_LICENSE_CHECKS = os.getenv("AUTO_CLONER_DISABLE_REMOTE_LICENSE", "0") != "1"
+license_cache = LicenseCache()
+
+# Licenses that allow redistribution
+ALLOWED_LICENSES = frozenset({"mit", "apache-2.0", "bsd-3-clause", "cc-by-4.0", "cc0-1.0", "unlicense"})
+
+_hub_requests = asyncio.BoundedSemaphore(MAX_CONCURRENT_HUB_REQUESTS)
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Runs a blocking Hugging Face Hub call in a worker thread so it doesn't stall the event loop.
+    The number of calls in flight is capped to avoid exhausting connections and file descriptors.
+    """
+    async with _hub_requests:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+def get_access_link(repo_name: str) -> str:
+    """
+    Constructs the Hugging Face URL for the given repository.
+    """
+    return f"https://huggingface.co/{repo_name}"
+
+def get_license(repo_name: str, token: str) -> str | None:
+    """
+    Looks up the license of the given model on Hugging Face, or None if it doesn't declare one.
+    """
+    model_info = cached_model_info(repo_name, token)
+    license = None
+
+    # Try to get license from model_info.license (may not exist)
+    if hasattr(model_info, 'license') and model_info.license:
+        license = model_info.license
+
+    # Try to get license from model_info.cardData
+    if not license and hasattr(model_info, 'cardData') and model_info.cardData:
+        license = model_info.cardData.get('license')
+
+    # Try to get license from model_info.tags
+    if not license:
+        license = next((tag.removeprefix('license:') for tag in (model_info.tags or ()) if tag.startswith('license:')), None)
+
+    return license
+
+def is_redistribution_allowed(repo_name: str, token: str) -> bool:
+    """
+    Checks if redistribution is allowed for the given model based on its license.
+    Licenses fetched within the last day are reused from the license cache.
+    """
+    try:
+        found, license = license_cache.lookup(repo_name, allow_stale=not REMOTE_LICENSE_CHECKS)
+        if not found:
+            if not REMOTE_LICENSE_CHECKS:
+                logger.warning(f"No cached license for {repo_name} and remote license checks are disabled.")
+                return False
+            license = get_license(repo_name, token)
+            license_cache.store(repo_name, license)
+
+        if not license:
+            logger.warning(f"License information not available for {repo_name}.")
+            return False
+
+        if license.lower() in ALLOWED_LICENSES:
+            return True
+        else:
+            logger.warning(f"Redistribution prohibited for {repo_name} under license: {license}")
+            return False
+
+    except Exception as e:
+        logger.error(f"Failed to retrieve license for {repo_name}: {e}")
+        return False
+
+async def get_model_size(repo_name: str, token: str) -> float:
+    """
+    Fetches the total size in gigabytes of the model files that will be copied from Hugging Face.
+    """
+    try:
+        model_info = await run_blocking(cached_model_info, repo_name, token)
+        copied_sizes = get_transfer_manifest(model_info, allow_patterns=ALLOW_PATTERNS, ignore_patterns=IGNORE_PATTERNS)
+        total_size_bytes = sum(size for size in copied_sizes.values() if size is not None)
+        total_size_gb = total_size_bytes / (1024 ** 3)  # Convert bytes to GB
+        return total_size_gb
+    except Exception as e:
+        logger.error(f"Failed to retrieve size for {repo_name}: {e}")
+        raise e
+
+async def get_required_space(repo_name: str, token: str) -> float:
+    """
+    Fetches the disk space in gigabytes needed to copy the model. When streaming, only a few files are on disk at
+    any time, so this is much less than the model size.
+    """
+    if not STREAM_UPLOADS:
+        return await get_model_size(repo_name, token)
+    try:
+        model_info = await run_blocking(cached_model_info, repo_name, token)
+        copied_sizes = get_transfer_manifest(model_info, allow_patterns=ALLOW_PATTERNS, ignore_patterns=IGNORE_PATTERNS)
+        return get_streamed_size(copied_sizes) / (1024 ** 3)  # Convert bytes to GB
+    except Exception as e:
+        logger.error(f"Failed to retrieve size for {repo_name}: {e}")
+        raise e
+
+def delete_tree(path: Path) -> None:
+    """
+    Deletes a directory tree, with rm -rf where it is available since it gets through large trees much faster.
+    """
+    if os.name == "posix" and shutil.which("rm"):
+        subprocess.run(["rm", "-rf", str(path)], check=False)
+    else:
+        shutil.rmtree(path, ignore_errors=True)
+
+def remove_in_background(path: Path) -> None:
+    """
+    Moves the directory out of the way and deletes it on a background thread.
+    The rename is a single metadata operation, so the caller can move on to the next model immediately.
+    """
+    trash_path = path.with_name(f"{path.name}.trash.{os.getpid()}.{time.time_ns()}")
+    os.rename(path, trash_path)
+    _cleanup_executor.submit(delete_tree, trash_path)
+
+def uploaded_cache_entry(repo_name: str, target_repo_name: str, token: str) -> dict:
+    """
+    Builds the cache entry recorded for a model once it has been uploaded, describing the files that were copied.
+    """
+    model_info = cached_model_info(repo_name, token)
+    copied_sizes = get_transfer_manifest(model_info, allow_patterns=ALLOW_PATTERNS, ignore_patterns=IGNORE_PATTERNS)
+    return {
+        "status": "uploaded",
+        "target": target_repo_name,
+        "size": sum(size for size in copied_sizes.values() if size is not None),
+        "file_count": len(copied_sizes),
+        "sha": model_info.sha,
+        "ts": time.time(),
+    }
+
+async def is_cached_upload(repo_name: str, target_repo_name: str, token: str, cache: CacheWriter) -> bool:
+    """
+    Checks if a previous run uploaded the model to this target repo, and the target repo still exists.
+    """
+    entry = cache.get(repo_name, {})
+    if entry.get("status") != "uploaded" or entry.get("target") != target_repo_name:
+        return False
+    try:
+        return await run_blocking(retry()(api.repo_exists), target_repo_name, token=token)
+    except Exception as e:
+        logger.error(f"Failed to check if {target_repo_name} exists, processing {repo_name} again. Error: {e}")
+        return False
+
+async def destination_has_source_files(repo_name: str, target_repo_name: str, token: str) -> bool:
+    """
+    Checks if the target repo already holds every file that would be copied from the source repo, with the same sizes.
+    This only compares metadata, so it lets reruns skip models without downloading anything.
+    """
+    try:
+        target_info = await run_blocking(cached_model_info, target_repo_name, token)
+    except RepositoryNotFoundError:
+        return False  # Repo doesn't exist, the Hub may also answer 401 for it
+    except HTTPError as e:
+        logger.error(f"Error checking repo existence for {target_repo_name}: {e}")
+        raise e
+
+    target_sizes = {sibling.rfilename: sibling.size for sibling in target_info.siblings}
+    source_info = await run_blocking(cached_model_info, repo_name, token)
+    source_sizes = get_transfer_manifest(source_info, allow_patterns=ALLOW_PATTERNS, ignore_patterns=IGNORE_PATTERNS)
+    # Stop at the first file that is missing or differs
+    mismatch = next((file_name for file_name, size in source_sizes.items() if target_sizes.get(file_name) != size), None)
+    if mismatch is not None:
+        logger.info(f"{target_repo_name} is missing {mismatch} or holds a different version of it.")
+    return mismatch is None
+
+def create_target_repo(target_repo_name: str, token: str) -> bool:
+    """
+    Creates the target repo in the organization. Returns False if it already existed.
+    """
+    try:
+        retry()(api.create_repo)(repo_id=target_repo_name, token=token, repo_type="model")
+        return True
+    except HTTPError as e:
+        if e.response is not None and e.response.status_code == 409:
+            return False  # Repo already exists
+        raise e
+
+async def delete_target_repo(target_repo_name: str, token: str) -> None:
+    """
+    Deletes a target repo created by this run once copying the model into it has failed.
+    """
+    logger.info(f"Attempting to delete the repository {target_repo_name}.")
+    try:
+        await run_blocking(api.delete_repo, repo_id=target_repo_name, token=token)
+        logger.info(f"Successfully deleted repository {target_repo_name} due to failed transfer.")
+    except Exception as delete_error:
+        logger.error(f"Failed to delete repository {target_repo_name}. Error: {delete_error}")
+
+async def download_and_upload_model(repo_name: str, local_download_model_dir: str, token: str, org_name: str, model_status: dict, cache: CacheWriter) -> None:
+    """
+    Downloads a model from Hugging Face, uploads it to a target repository, and deletes the local copy.
+    Updates the model_status dictionary with the status of the model, and records successful uploads in the cache.
+    """
+    model_name = Path(repo_name).name
+    local_model_dir = Path(local_download_model_dir) / model_name
+    try:
+        # Check the license and what the organization already holds at the same time
+        redistribution_allowed, already_uploaded = await asyncio.gather(
+            run_blocking(is_redistribution_allowed, repo_name, token),
+            destination_has_source_files(repo_name, f"{org_name}/{model_name}", token),
+            return_exceptions=True,
+        )
+
+        # Check if redistribution is allowed
+        if redistribution_allowed is not True:
+            logger.warning(f"Redistribution prohibited for {repo_name}. Skipping upload.")
+            model_status[repo_name] = "Cannot upload due to license restrictions"
+            # Proceed to check if manual acceptance is needed
+            access_link = get_access_link(repo_name)
+            print(f"\nThe model {repo_name} may require manual license acceptance or access request.")
+            print(f"Please visit {access_link} to accept the license agreement or request access if needed.\n")
+            return
+
+        # Check if the repo already exists and has all files in the organization
+        if isinstance(already_uploaded, BaseException):
+            raise already_uploaded
+        if already_uploaded:
+            logger.info(f"Repository {model_name} already exists with all files in the organization {org_name}. Skipping download.")
+            model_status[repo_name] = "Already exists in the organization"
+            return
+
+        # Mark the model as in flight, so a later run can tell it was interrupted
+        cache.set(repo_name, {"status": "in_progress", "ts": time.time()})
+
+        # Create the repo if it doesn't exist in the organization, while the model downloads.
+        # When streaming, the files are only downloaded once the repo exists, so there is nothing to overlap with.
+        logger.info(f"Creating repository {model_name}")
+        create_repo_task = asyncio.create_task(run_blocking(create_target_repo, f"{org_name}/{model_name}", token))
+
+        try:
+            # When streaming, files are downloaded as part of the upload
+            if not STREAM_UPLOADS:
+                # Skip download if model already exists locally
+                if local_model_dir.exists():
+                    logger.warning(f"Model directory {local_model_dir} already exists. Skipping download.")
+                else:
+                    model_size = await get_model_size(repo_name, token)
+                    logger.info(f"Starting download for {repo_name} (Estimated size: {model_size:.2f} GB)")
+                    await asyncio.to_thread(
+                        download_from_hf,
+                        repo_name=repo_name,
+                        local_model_dir=local_model_dir,
+                        file_name=None,
+                        token=token,
+                        allow_patterns=ALLOW_PATTERNS,
+                        ignore_patterns=IGNORE_PATTERNS,
+                    )
+                    logger.info(f"Successfully downloaded model: {repo_name}")
+        except Exception:
+            # Wait for the repo creation, and don't leave an empty repo behind in the organization
+            (repo_created,) = await asyncio.gather(create_repo_task, return_exceptions=True)
+            if repo_created is True:
+                await delete_target_repo(f"{org_name}/{model_name}", token)
+            raise
+        repo_created = await create_repo_task
+
+        # Try to upload the model
+        try:
+            if STREAM_UPLOADS:
+                await stream_to_hub(
+                    repo_name=repo_name,
+                    model_name=f"{org_name}/{model_name}",
+                    local_model_dir=local_model_dir,
+                    token=token,
+                    allow_patterns=ALLOW_PATTERNS,
+                    ignore_patterns=IGNORE_PATTERNS,
+                )
+            else:
+                await asyncio.to_thread(
+                    push_to_hub, model_name=f"{org_name}/{model_name}", model_path=local_model_dir, token=token
+                )
+            logger.info(f"Successfully uploaded model: {model_name}")
+            model_status[repo_name] = "Uploaded successfully"
+        except Exception as upload_error:
+            logger.error(f"Upload failed for {model_name}.")
+            if repo_created:
+                await delete_target_repo(f"{org_name}/{model_name}", token)
+            model_status[repo_name] = f"Upload failed: {upload_error}"
+            raise upload_error  # Reraise the upload error to propagate failure
+
+        # Remember the upload so later runs can skip this model
+        cache.set(repo_name, await run_blocking(uploaded_cache_entry, repo_name, f"{org_name}/{model_name}", token))
+
+    except Exception as e:
+        logger.error(f"Error during process for {repo_name}. Error: {e}")
+        model_status[repo_name] = f"Failed: {e}"
+        cache.set(repo_name, {"status": "failed", "error": str(e), "ts": time.time()})
+
+    finally:
+        # The target repo may have been created, updated or deleted
+        invalidate_model_info(f"{org_name}/{model_name}")
+        # Ensure cleanup happens
+        try:
+            if local_model_dir.exists():
+                logger.info(f"Cleaning up local model directory for {model_name}")
+                remove_in_background(local_model_dir)
+                logger.info(f"Scheduled deletion of local files for {model_name}")
+        except OSError as cleanup_error:
+            logger.error(f"Failed to clean up model directory {local_model_dir}. Error: {cleanup_error}")
+
+def record_failures(results: dict, model_status: dict) -> None:
+    """
+    Records in model_status every model whose processing ended with an unhandled exception.
+    """
+    for repo_name, result in results.items():
+        if isinstance(result, BaseException):
+            logger.error(f"Unhandled error while processing {repo_name}: {result}")
+            model_status[repo_name] = f"Failed: {result}"
+
+_GB = 1 << 30
+
+def get_free_space_gb() -> float:
+    """Returns the available disk space in gigabytes."""
+    if hasattr(os, "statvfs"):
+        stats = os.statvfs("/")
+        return stats.f_bavail * stats.f_frsize / _GB
+    return shutil.disk_usage("/").free / _GB
+
+class SpaceAccountant:
+    """
+    Keeps track of the disk space reserved by active downloads.
+    A download only starts once its model fits both within the space budget and on the disk.
+    """
+
+    def __init__(self, total_space_to_use: float, min_free_space: float):
+        self.total_space_to_use = total_space_to_use
+        self.min_free_space = min_free_space
+        self.reserved_space = 0.0
+        self._condition = asyncio.Condition()
+
+    def fits(self, model_size: float) -> bool:
+        # Active downloads may not have written their files yet, so their reservations still have to come out of the
+        # free space. This errs on the safe side for the part of them that is already on disk.
+        free_space = get_free_space_gb() - self.reserved_space
+        return free_space - model_size >= self.min_free_space and self.reserved_space + model_size <= self.total_space_to_use
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, repo_name: str, model_size: float):
+        """
+        Waits until the model fits, and holds its space until the context exits.
+        """
+        async with self._condition:
+            while not self.fits(model_size):
+                logger.info(f"Waiting for space for {repo_name}... Current free space: {get_free_space_gb():.2f} GB, Required: {model_size:.2f} GB")
+                # Wake up as soon as a download releases its space. Still recheck periodically, since local files are
+                # deleted in the background and disk space can also be freed outside of this script.
+                try:
+                    await asyncio.wait_for(self._condition.wait(), timeout=SPACE_RECHECK_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            self.reserved_space += model_size
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self.reserved_space -= model_size
+                self._condition.notify_all()
+
+async def process_model_queue(repo_name_queue, local_download_model_dir, token, org_name, model_status, cache):
+    """
+    Processes the queue of models concurrently while ensuring the disk space constraints are met.
+    Size lookups run ahead of the downloads, and a model that does not fit yet doesn't hold back smaller ones behind it.
+    Updates the model_status dictionary with the status of each model.
+    """
+    metadata_slots = asyncio.BoundedSemaphore(MAX_CONCURRENT_METADATA_REQUESTS)
+    download_slots = asyncio.BoundedSemaphore(MAX_CONCURRENT_DOWNLOADS)
+    space_accountant = SpaceAccountant(TOTAL_SPACE_TO_USE, MIN_FREE_SPACE)
+
+    async def schedule(repo_name: str) -> None:
+        # Estimate the disk space needed using Hugging Face API
+        try:
+            async with metadata_slots:
+                required_space = await get_required_space(repo_name, token)
+        except Exception as e:
+            logger.error(f"Skipping model {repo_name} due to error: {e}")
+            model_status[repo_name] = f"Failed to get size: {e}"
+            return
+
+        if required_space > TOTAL_SPACE_TO_USE:
+            logger.error(f"Skipping model {repo_name}, it needs {required_space:.2f} GB which exceeds the space budget.")
+            model_status[repo_name] = f"Too large: {required_space:.2f} GB"
+            return
+
+        # Wait for space before taking a download slot, so models waiting for space don't hold back smaller ones
+        async with space_accountant.reserve(repo_name, required_space), download_slots:
+            logger.info(f"Starting download for {repo_name}. Estimated disk space needed: {required_space:.2f} GB")
+            await download_and_upload_model(repo_name, local_download_model_dir, token, org_name, model_status, cache)
+
+    results = await asyncio.gather(*(schedule(repo_name) for repo_name in repo_name_queue), return_exceptions=True)
+    record_failures(dict(zip(repo_name_queue, results)), model_status)
+
+async def main(repo_name_list: list, local_download_model_dir: str, token: str, org_name: str) -> dict:
+    """
+    Copies every model of the list into the organization, skipping the ones already uploaded by previous runs.
+    Returns the status of each model.
+    """
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE))
+    log_hash_backend()
+    log_transfer_backend()
+    model_status = {}  # Dictionary to keep track of model statuses
+    cache = CacheWriter()  # Models uploaded by previous runs
+
+    cached_uploads = await asyncio.gather(
+        *(is_cached_upload(repo_name, f"{org_name}/{Path(repo_name).name}", token, cache) for repo_name in repo_name_list)
+    )
+    repo_name_queue = []
+    for repo_name, cached_upload in zip(repo_name_list, cached_uploads):
+        if cached_upload:
+            logger.info(f"Skipping {repo_name}, it was already uploaded in a previous run.")
+            model_status[repo_name] = "Already uploaded (cached)"
+        else:
+            if cache.get(repo_name, {}).get("status") == "in_progress":
+                logger.warning(f"Processing of {repo_name} was interrupted in a previous run. Retrying.")
+            repo_name_queue.append(repo_name)
+
+    await process_model_queue(repo_name_queue, local_download_model_dir, token, org_name, model_status, cache)
+    return model_status
+
+def print_summary(model_status: dict) -> None:
+    """
+    Outputs the status of every model once processing is over.
+    """
+    print("\nSummary of model processing:")
+    print("{:<50} {}".format("Model", "Status"))
+    print("-" * 70)
+    for repo_name, status in model_status.items():
+        print("{:<50} {}".format(repo_name, status))
+
+def load_repo_names(path: Path) -> list:
+    """
+    Reads the models to process from a text file with one repository per line.
+    Blank lines and lines starting with # are skipped.
+    """
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+def read_credentials() -> tuple:
+    """
+    Reads the Hugging Face token and the target organization name from the environment, exiting if either is missing.
+    """
+    # Get Hugging Face token from environment variables
+    token = os.getenv("HF_TOKEN")
+    if not token:
+        logger.warning("HF token is not provided. Please export HF_TOKEN to the environment variable.")
+        sys.exit(1)
+
+    # Get organization name from environment variables
+    org_name = os.getenv("ORG_NAME")
+    if not org_name:
+        logger.warning("Organization name is not provided. Please export ORG_NAME to the environment variable.")
+        sys.exit(1)
+
+    return token, org_name
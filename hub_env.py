@@ -0,0 +1,12 @@
+"""Environment defaults for huggingface_hub, which reads them once when it is first imported.
+
+Import this module before anything that imports huggingface_hub.
+"""
+
+import importlib.util
+import os
+
+# Use the Rust hf_transfer backend for chunk-parallel transfers when it is installed.
+# Export HF_HUB_ENABLE_HF_TRANSFER=0 to fall back to the pure Python client.
+if importlib.util.find_spec("hf_transfer") is not None:
+    os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
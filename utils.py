@@ -1,102 +1,384 @@
 """Utils functions for loading models from huggingfacehub."""
 
 # ───────────────────────────────────────────────────── imports ────────────────────────────────────────────────────── #
+import asyncio
+import functools
+import hashlib
+import os
+import random
+import ssl
+import time
+from collections.abc import Iterator
 from pathlib import Path
 
-from huggingface_hub import HfApi, HfFileSystem, create_repo, snapshot_download
+import hub_env  # noqa: F401, has to come before huggingface_hub
+import requests
+from huggingface_hub import (
+    CommitOperationAdd,
+    HfApi,
+    configure_http_backend,
+    constants,
+    hf_hub_download,
+    snapshot_download,
+)
+from huggingface_hub.hf_api import ModelInfo
+from huggingface_hub.utils import DEFAULT_IGNORE_PATTERNS, RepositoryNotFoundError, filter_repo_objects
+from huggingface_hub.utils._http import OfflineAdapter, UniqueRequestIdAdapter
 from loguru import logger
 
+REGULAR_FILE_MAX_SIZE = 10 * 1024 * 1024  # Files above this size are always stored through LFS on the Hub
+DOWNLOAD_WORKERS = 8  # Files downloaded concurrently by snapshot_download
+UPLOAD_WORKERS = 8  # Files uploaded concurrently by stream_to_hub
+QUEUED_FILES = 4  # Downloaded files waiting for an upload slot in stream_to_hub
+ETAG_TIMEOUT = 30  # Seconds to wait for file metadata before a download gives up
 
-def download_from_hf(
-    repo_name: str, local_model_dir: Path, file_name: str | None = None, token: str | None = None
-) -> str:
-    """Download an entire repo from Huggingface, to avoid loading the model into RAM.
+# huggingface_hub keeps one session per thread. Mounting the same adapter on each of them makes every thread draw
+# from a single keep-alive connection pool, so TLS handshakes are amortised over the whole run. Failed connection
+# attempts, ex. on a pooled connection the server has since closed, are retried transparently.
+# The adapters are the ones huggingface_hub uses by default, so requests keep their request id and offline mode
+# (HF_HUB_OFFLINE=1) still fails fast.
+if constants.HF_HUB_OFFLINE:
+    _http_adapter = OfflineAdapter()
+else:
+    _http_adapter = UniqueRequestIdAdapter(pool_connections=64, pool_maxsize=64, max_retries=3)
 
-    Note: we only download pytorch models (ex. .bin files) if they are available.
-    we download .safetensors files when there is only safetensors available.
 
-    We do this to avoid download extra files that we dont need. (ex. msgpack, h5, etc.)
+def _backend_factory() -> requests.Session:
+    """Create the HTTP session huggingface_hub uses for a thread, backed by the shared connection pool."""
+    session = requests.Session()
+    session.mount("http://", _http_adapter)
+    session.mount("https://", _http_adapter)
+    return session
+
+
+configure_http_backend(backend_factory=_backend_factory)
+
+api = HfApi()  # Shared client, pass the token to each call
+
+
+def log_hash_backend() -> None:
+    """Log which implementation hashlib uses for SHA-256.
+
+    Every file uploaded through LFS is hashed before it is sent, so a hashlib that is not backed by OpenSSL
+    (and its SHA extensions) noticeably slows down uploads of large shards.
+    """
+    if type(hashlib.sha256()).__module__ == "_hashlib":
+        logger.info(f"SHA-256 hashing is backed by {ssl.OPENSSL_VERSION}")
+    else:
+        logger.warning("hashlib is not backed by OpenSSL, hashing large files before upload will be slow")
+
+
+def log_transfer_backend() -> None:
+    """Log whether transfers go through the Rust hf_transfer backend.
+
+    huggingface_hub reads HF_HUB_ENABLE_HF_TRANSFER once, when it is first imported, so a change in import order
+    can quietly turn the backend off.
+    """
+    if constants.HF_HUB_ENABLE_HF_TRANSFER:
+        logger.info("Transfers go through the hf_transfer backend")
+    elif os.environ.get("HF_HUB_ENABLE_HF_TRANSFER", "").upper() in constants.ENV_VARS_TRUE_VALUES:
+        logger.warning("HF_HUB_ENABLE_HF_TRANSFER was set after huggingface_hub was imported, hf_transfer is not used")
+    else:
+        logger.info("Transfers go through the default Python client, hf_transfer is disabled")
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Tell whether a failed request is worth retrying.
+
+    Connection failures, timeouts, rate limiting (429) and server errors (5xx) are transient, anything else
+    (ex. 401, 404, 409) will fail the same way again.
+
+    The errors the error was raised from are checked as well: huggingface_hub downloads turn a failed metadata
+    request into a LocalEntryNotFoundError, which only keeps the original error as its cause.
 
     Args:
-        repo_name (str): model name / repo name
-        local_model_dir (Path): local model directory
-        token (str, optional): huggingface token. Defaults to None.
+        error (Exception): error raised by the request
 
     Returns:
-        str: location of the model
+        bool: True if the request should be retried
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+            return True
+        response = getattr(error, "response", None)
+        if response is not None and (response.status_code == 429 or response.status_code >= 500):
+            return True
+        error = error.__cause__
+    return False
+
+
+def retry(max_attempts: int = 3, base: float = 2, max_wait: float = 60):
+    """Retry a function on transient errors, with exponential backoff and full jitter.
+
+    Args:
+        max_attempts (int, optional): total number of attempts. Defaults to 3.
+        base (float, optional): base of the exponential backoff, in seconds. Defaults to 2.
+        max_wait (float, optional): upper bound on a single wait, in seconds. Defaults to 60.
     """
-    fs = HfFileSystem(token=token)
 
-    # List all the files in the directory
-    files = fs.ls(repo_name, detail=False)
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            for attempt in range(1, max_attempts + 1):
+                try:
+                    return func(*args, **kwargs)
+                except Exception as e:
+                    if attempt == max_attempts or not is_transient_error(e):
+                        raise
+                    wait = random.uniform(0, min(max_wait, base**attempt))
+                    logger.warning(
+                        f"{func.__name__} failed ({e}), retrying in {wait:.1f}s (attempt {attempt}/{max_attempts})"
+                    )
+                    time.sleep(wait)
 
-    # check for an index.json file type and use that type
-    file_indexes = [f for f in files if f.endswith(".index.json")]
+        return wrapper
 
-    # are we dealing with a distributed download, in which case only download the copy with the .index.json type
-    multi_file = len(file_indexes) > 0
-    logger.debug("index.json files: ", file_indexes)
-    if multi_file:
-        # are there any .bin.index.json files
-        any_bin_files = any(f for f in file_indexes if f.endswith("bin.index.json"))
-        any_pt_files = any(f for f in file_indexes if f.endswith("pt.index.json"))
-        any_pth_files = any(f for f in file_indexes if f.endswith("pth.index.json"))
+    return decorator
 
-        available_torch_files = any_bin_files or any_pt_files or any_pth_files
 
-        # are there any .safetensors.index.json files
-        available_safetensors_files = any(f for f in file_indexes if f.endswith("safetensors.index.json"))
-        logger.debug("Torch model files available: ", available_torch_files)
-        logger.debug("Safetensors files available: ", available_safetensors_files)
+# Weight formats skipped when only .safetensors weights are available
+SAFETENSORS_ONLY_IGNORE_PATTERNS = (
+    "*.msgpack",
+    "*.h5",
+    "coreml/**/*",
+    "*.tflite",
+    "*.onnx",
+    "*.bin",
+    "*.pt",
+    "*.pth",
+    "*.gguf",
+)
+# Weight formats skipped when pytorch weights are available
+TORCH_IGNORE_PATTERNS = (
+    "*.msgpack",
+    "*.h5",
+    "*.safetensors",
+    "coreml/**/*",
+    "*safetensors*",
+    "*.ot",
+    "*.tflite",
+    "*.onnx",
+    "*.gguf",
+)
+TORCH_SUFFIXES = (".bin", ".pt", ".pth")
+TORCH_INDEX_SUFFIXES = ("bin.index.json", "pt.index.json", "pth.index.json")
+WEIGHT_SUFFIXES = TORCH_SUFFIXES + (".safetensors",)
 
-    else:
-        # check if there are .torch files
-        available_torch_files = any(f for f in files if (f.endswith(".bin") or f.endswith(".pt") or f.endswith(".pth")))
 
-        # check if there are .safetensors files:
-        available_safetensors_files = any(f for f in files if f.endswith(".safetensors"))
+def _select_ignore_patterns(files: list[str]) -> list[str]:
+    """Choose which weight formats to skip for a repo, given the files it contains.
+
+    Pytorch weights are kept when they are available, otherwise the .safetensors weights are kept.
+    Only files at the root of the repo are considered, so that extra checkpoints in subfolders
+    (ex. original/consolidated.00.pth) don't decide the format. The file list is classified in a single pass.
+
+    Args:
+        files (list[str]): files in the repo
+
+    Returns:
+        list[str]: glob patterns of the files to skip
+    """
+    any_torch_index = any_safetensors_index = any_torch_files = any_safetensors_files = False
+    for f in files:
+        if "/" in f:
+            continue
+        if f.endswith(".index.json"):
+            if f.endswith(TORCH_INDEX_SUFFIXES):
+                any_torch_index = True
+            elif f.endswith("safetensors.index.json"):
+                any_safetensors_index = True
+        elif f.endswith(TORCH_SUFFIXES):
+            any_torch_files = True
+        elif f.endswith(".safetensors"):
+            any_safetensors_files = True
+
+    # are we dealing with a distributed download, in which case only download the copy with the .index.json type.
+    # An index only counts along with its shards, which may have been dropped by the ignore patterns.
+    torch_sharded = any_torch_index and any_torch_files
+    safetensors_sharded = any_safetensors_index and any_safetensors_files
+    if torch_sharded or safetensors_sharded:
+        available_torch_files, available_safetensors_files = torch_sharded, safetensors_sharded
+    else:
+        available_torch_files, available_safetensors_files = any_torch_files, any_safetensors_files
+    logger.debug(
+        f"Torch model files available: {available_torch_files}, "
+        f"safetensors files available: {available_safetensors_files}"
+    )
 
     # use pytorch if it is available, if it isnt then assume .safetensors is available
     # e.g. this is the case with llama 2.
     safe_only = available_safetensors_files and (not available_torch_files)
 
-    if safe_only:
-        snapshot_patterns = [
-            "*.msgpack",
-            "*.h5",
-            "coreml/**/*",
-            "*.tflite",
-            "*.onnx",
-            "*.bin",
-            "*.pt",
-            "*.pth",
-            "*.gguf",
-        ]
-    else:
-        snapshot_patterns = [
-            "*.msgpack",
-            "*.h5",
-            "*.safetensors",
-            "coreml/**/*",
-            "*safetensors*",
-            "*.ot",
-            "*.tflite",
-            "*.onnx",
-            "*.gguf",
-        ]
+    return list(SAFETENSORS_ONLY_IGNORE_PATTERNS if safe_only else TORCH_IGNORE_PATTERNS)
+
+
+def _weight_ignore_patterns(
+    files: list[str], allow_patterns: list[str] | None = None, ignore_patterns: list[str] | None = None
+) -> list[str]:
+    """Choose which weight formats to skip, unless the allow patterns already choose them.
+
+    The format is chosen among the files left once the ignore patterns are applied, so ignoring one format
+    (ex. "*.bin") makes the other one be copied.
+
+    Args:
+        files (list[str]): files in the repo
+        allow_patterns (list[str], optional): patterns of the files to copy. Defaults to None.
+        ignore_patterns (list[str], optional): patterns of the files skipped anyway. Defaults to None.
+
+    Returns:
+        list[str]: glob patterns of the files to skip
+    """
+    if allow_patterns:
+        return []
+    return _select_ignore_patterns(list(filter_repo_objects(files, ignore_patterns=ignore_patterns)))
+
+
+def _filter_files(
+    files: list[str], allow_patterns: list[str] | None = None, ignore_patterns: list[str] | None = None
+) -> list[str]:
+    """Keep the files of a repo that should be copied.
+
+    When `allow_patterns` are given they decide which weight formats are copied, otherwise a single format is
+    selected automatically among the files that `ignore_patterns` leave.
+
+    Args:
+        files (list[str]): files in the repo
+        allow_patterns (list[str], optional): only keep files matching one of these patterns. Defaults to None.
+        ignore_patterns (list[str], optional): also skip files matching these patterns. Defaults to None.
+
+    Returns:
+        list[str]: files to copy
+    """
+    ignore_patterns = _weight_ignore_patterns(files, allow_patterns, ignore_patterns) + (ignore_patterns or [])
+    return list(filter_repo_objects(files, allow_patterns=allow_patterns, ignore_patterns=ignore_patterns))
+
+
+def _check_has_weights(repo_name: str, files: list[str]) -> None:
+    """Fail a transfer that would not copy any weights, ex. when the allow patterns exclude every weight file.
+
+    Args:
+        repo_name (str): model name / repo name
+        files (list[str]): files that would be copied
+
+    Raises:
+        ValueError: if none of the files holds weights
+    """
+    if not any(file_name.endswith(WEIGHT_SUFFIXES) for file_name in files):
+        raise ValueError(f"No weight files of {repo_name} match the allow and ignore patterns")
+
+
+def iter_local_files(root: Path | str, prefix: str = "") -> Iterator[str]:
+    """Yield every file below a directory, as a path relative to it using forward slashes.
+
+    Walks the tree with os.scandir, so file types come from the directory listing itself rather than from a
+    separate stat call per entry.
+
+    Args:
+        root (Path | str): directory to walk
+        prefix (str, optional): prefix added to each yielded path. Defaults to "".
+
+    Yields:
+        str: relative path of each file
+    """
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_local_files(entry.path, f"{prefix}{entry.name}/")
+            elif entry.is_file(follow_symlinks=False):
+                yield f"{prefix}{entry.name}"
+
+
+def get_transfer_manifest(
+    model_info: ModelInfo,
+    allow_patterns: list[str] | None = None,
+    ignore_patterns: list[str] | None = None,
+) -> dict[str, int | None]:
+    """List the files that would be copied from a repo, with their sizes.
+
+    The same files as `download_from_hf` and `stream_to_hub` are skipped.
+
+    Args:
+        model_info (ModelInfo): info of the repo, fetched with its files metadata
+        allow_patterns (list[str], optional): only copy files matching one of these patterns. Defaults to None.
+        ignore_patterns (list[str], optional): also skip files matching these patterns. Defaults to None.
+
+    Returns:
+        dict[str, int | None]: size in bytes of each file, keyed by path in the repo
+    """
+    sizes = {sibling.rfilename: sibling.size for sibling in model_info.siblings}
+    kept_files = _filter_files(list(sizes), allow_patterns=allow_patterns, ignore_patterns=ignore_patterns)
+    return {file_name: sizes[file_name] for file_name in kept_files}
+
+
+def get_streamed_size(
+    sizes: dict[str, int | None],
+    max_queued_files: int = QUEUED_FILES,
+    max_uploads: int = UPLOAD_WORKERS,
+    max_downloads: int = DOWNLOAD_WORKERS,
+) -> int:
+    """Bound the disk space `stream_to_hub` needs to copy a repo.
+
+    At most `max_downloads + max_queued_files + max_uploads` files are on disk at once, so this is the size of that
+    many of the largest files. Repos with at most one weight file are staged whole before being pushed.
+
+    Args:
+        sizes (dict[str, int | None]): size in bytes of each copied file, as returned by `get_transfer_manifest`
+        max_queued_files (int, optional): same as for `stream_to_hub`. Defaults to QUEUED_FILES.
+        max_uploads (int, optional): same as for `stream_to_hub`. Defaults to UPLOAD_WORKERS.
+        max_downloads (int, optional): same as for `stream_to_hub`. Defaults to DOWNLOAD_WORKERS.
+
+    Returns:
+        int: disk space in bytes
+    """
+    file_sizes = sorted((size or 0 for size in sizes.values()), reverse=True)
+    if sum(file_name.endswith(WEIGHT_SUFFIXES) for file_name in sizes) <= 1:
+        return sum(file_sizes)
+    return sum(file_sizes[: max_downloads + max_queued_files + max_uploads])
+
+
+@retry()
+def download_from_hf(
+    repo_name: str,
+    local_model_dir: Path,
+    file_name: str | None = None,
+    token: str | None = None,
+    allow_patterns: list[str] | None = None,
+    ignore_patterns: list[str] | None = None,
+) -> str:
+    """Download an entire repo from Huggingface, to avoid loading the model into RAM.
+
+    Note: we only download pytorch models (ex. .bin files) if they are available.
+    we download .safetensors files when there is only safetensors available.
+    The format is chosen from the files at the root of the repo that the ignore patterns leave, and not at all
+    when allow_patterns are given.
+
+    We do this to avoid download extra files that we dont need. (ex. msgpack, h5, etc.)
+
+    Args:
+        repo_name (str): model name / repo name
+        local_model_dir (Path): local model directory
+        token (str, optional): huggingface token. Defaults to None.
+        allow_patterns (list[str], optional): only download files matching one of these patterns. Defaults to None.
+        ignore_patterns (list[str], optional): also skip files matching these patterns. Defaults to None.
+
+    Returns:
+        str: location of the model
+    """
+    # List all the files in the repo
+    files = api.list_repo_files(repo_name, token=token)
 
     # if file_name is given, then only download that file.
-    allow_patterns = None
     if file_name is not None:
         allow_patterns = [file_name]
+    else:
+        _check_has_weights(repo_name, _filter_files(files, allow_patterns=allow_patterns, ignore_patterns=ignore_patterns))
 
-    marker_path = local_model_dir / "download_in_progress_marker"
+    snapshot_patterns = _weight_ignore_patterns(files, allow_patterns, ignore_patterns) + (ignore_patterns or [])
 
+    # Interrupted downloads are tracked by snapshot_download itself through its .incomplete files
     local_model_dir.mkdir(parents=True, exist_ok=True)
-    # Open the file in write mode, which creates the file if it doesn't exist
-    with open(marker_path, "w") as _:
-        pass
-        # Since we want to create an empty file, we don't write anything
     logger.info("Beginning download")
     location = snapshot_download(
         repo_id=repo_name,
@@ -106,29 +388,198 @@ def download_from_hf(
         ignore_patterns=snapshot_patterns,
         token=token,
         resume_download=True,
+        max_workers=DOWNLOAD_WORKERS,
+        etag_timeout=ETAG_TIMEOUT,
     )
 
-    marker_path.unlink()
-
     return location
 
 
-def push_to_hub(model_name: str, model_path: str, token: str) -> None:
+@retry()
+def push_to_hub(model_name: str, model_path: str, token: str, num_threads: int = 8) -> None:
     """Push a model to the Hugging Face Hub
 
+    All files go into a single commit, while their LFS content is uploaded over `num_threads` parallel
+    connections rather than one file after the other. The target repo must already exist.
+
     Args:
         model_name (str): model name. Should be "opt-125m", not "facebook/opt-125m"
         model_path (str): path to the local model directory
         token (str): HF token
+        num_threads (int, optional): number of files uploaded concurrently. Defaults to 8.
     """
     hub_id = f"{model_name}"
-    api = HfApi(token=token)
 
-    create_repo(hub_id, token=token, repo_type="model")
-
-    api.upload_folder(
-        folder_path=model_path,
+    model_path = Path(model_path)
+    local_files = list(iter_local_files(model_path))
+    operations = [
+        CommitOperationAdd(path_in_repo=path_in_repo, path_or_fileobj=str(model_path / path_in_repo))
+        for path_in_repo in filter_repo_objects(local_files, ignore_patterns=DEFAULT_IGNORE_PATTERNS)
+    ]
+    api.create_commit(
         repo_id=hub_id,
-        repo_type="model",
+        operations=operations,
+        commit_message="Upload folder using huggingface_hub",
+        num_threads=num_threads,
+        token=token,
     )
     logger.info(f"Model pushed to Hugging Face Hub: {hub_id}")
+
+
+def _preupload_file(model_name: str, path_in_repo: str, path: Path, token: str) -> CommitOperationAdd:
+    """Prepare a file for a commit, uploading its content first if it is stored through LFS.
+
+    Building the operation reads the whole file to hash it, so this should run in a worker thread.
+
+    Args:
+        model_name (str): target repo name
+        path_in_repo (str): path of the file in the target repo
+        path (Path): local path of the file
+        token (str): HF token
+
+    Returns:
+        CommitOperationAdd: operation to include in the commit
+    """
+    # Small files are sent inline with the commit, so keep their content in memory rather than on disk
+    content = path.read_bytes() if path.stat().st_size <= REGULAR_FILE_MAX_SIZE else str(path)
+    operation = CommitOperationAdd(path_in_repo=path_in_repo, path_or_fileobj=content)
+    retry()(api.preupload_lfs_files)(model_name, additions=[operation], token=token)
+    return operation
+
+
+async def _run_to_completion(func, *args, **kwargs):
+    """Run a blocking call in a worker thread.
+
+    A thread can't be interrupted, so when the caller is cancelled this still waits for the call to return
+    before propagating the cancellation.
+    """
+    call = asyncio.ensure_future(asyncio.to_thread(func, *args, **kwargs))
+    try:
+        return await asyncio.shield(call)
+    except asyncio.CancelledError:
+        await asyncio.gather(call, return_exceptions=True)
+        raise
+
+
+async def stream_to_hub(
+    repo_name: str,
+    model_name: str,
+    local_model_dir: Path,
+    token: str,
+    max_queued_files: int = QUEUED_FILES,
+    max_uploads: int = UPLOAD_WORKERS,
+    max_downloads: int = DOWNLOAD_WORKERS,
+    allow_patterns: list[str] | None = None,
+    ignore_patterns: list[str] | None = None,
+) -> None:
+    """Copy a repo to the Hugging Face Hub file by file, uploading each file as soon as it is downloaded.
+
+    Downloads and uploads overlap, and each file is deleted as soon as its content has been uploaded, so only
+    about `max_downloads + max_queued_files + max_uploads` files are on disk at any time instead of the whole model.
+    Everything lands in the target repo as a single commit once all files have been uploaded.
+
+    Repos with at most one weight file have nothing to overlap, so they are downloaded with `download_from_hf`
+    and then pushed with `push_to_hub` instead.
+
+    The same files as `download_from_hf` are skipped.
+
+    Args:
+        repo_name (str): source model name / repo name
+        model_name (str): target repo name. Should include the namespace, ex. "my-org/opt-125m"
+        local_model_dir (Path): local directory used to stage the files
+        token (str): HF token
+        max_queued_files (int, optional): downloaded files allowed to wait for an upload slot. Defaults to QUEUED_FILES.
+        max_uploads (int, optional): number of files uploaded concurrently. Defaults to UPLOAD_WORKERS.
+        max_downloads (int, optional): number of files downloaded concurrently. Defaults to DOWNLOAD_WORKERS.
+        allow_patterns (list[str], optional): only copy files matching one of these patterns. Defaults to None.
+        ignore_patterns (list[str], optional): also skip files matching these patterns. Defaults to None.
+    """
+    files = await asyncio.to_thread(retry()(api.list_repo_files), repo_name, token=token)
+    files = _filter_files(files, allow_patterns=allow_patterns, ignore_patterns=ignore_patterns)
+    _check_has_weights(repo_name, files)
+
+    if sum(file_name.endswith(WEIGHT_SUFFIXES) for file_name in files) <= 1:
+        logger.info(f"{repo_name} has a single weight file, downloading it before uploading")
+        await asyncio.to_thread(
+            download_from_hf,
+            repo_name=repo_name,
+            local_model_dir=local_model_dir,
+            token=token,
+            allow_patterns=allow_patterns,
+            ignore_patterns=ignore_patterns,
+        )
+        await asyncio.to_thread(push_to_hub, model_name=model_name, model_path=local_model_dir, token=token)
+        return
+
+    local_model_dir.mkdir(parents=True, exist_ok=True)
+    downloaded: asyncio.Queue = asyncio.Queue(maxsize=max_queued_files)
+    upload_slots = asyncio.Semaphore(max_uploads)
+    operations = []
+
+    pending_files = iter(files)  # Shared by the download workers, each file is taken by exactly one of them
+
+    async def download_files() -> None:
+        for file_name in pending_files:
+            path = await _run_to_completion(
+                retry()(hf_hub_download),
+                repo_id=repo_name,
+                filename=file_name,
+                local_dir=str(local_model_dir),
+                token=token,
+                etag_timeout=ETAG_TIMEOUT,
+            )
+            await downloaded.put((file_name, Path(path)))
+
+    async def upload_file(file_name: str, path: Path) -> None:
+        try:
+            operations.append(await _run_to_completion(_preupload_file, model_name, file_name, path, token))
+        finally:
+            upload_slots.release()
+        path.unlink()
+
+    async def next_file() -> tuple[str, Path]:
+        await upload_slots.acquire()
+        return await downloaded.get()
+
+    async def upload_files() -> None:
+        uploads = set()
+        file_ready = None
+        try:
+            for _ in files:
+                file_ready = asyncio.ensure_future(next_file())
+                # Watch the running uploads while waiting, so a failed upload stops the transfer right away
+                # instead of once every remaining file has been copied
+                while not file_ready.done():
+                    done, _ = await asyncio.wait(uploads | {file_ready}, return_when=asyncio.FIRST_COMPLETED)
+                    for upload in done & uploads:
+                        uploads.discard(upload)
+                        upload.result()
+                uploads.add(asyncio.create_task(upload_file(*file_ready.result())))
+            await asyncio.gather(*uploads)
+        finally:
+            pending = [*uploads, file_ready] if file_ready is not None else list(uploads)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    logger.info(f"Streaming {len(files)} files from {repo_name} to {model_name}")
+    producers = [asyncio.create_task(download_files()) for _ in range(min(max_downloads, len(files)))]
+    consumer = asyncio.create_task(upload_files())
+    tasks = producers + [consumer]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        # If any of them failed, stop the others instead of leaving them blocked on the queue, and wait for them
+        # so that nothing writes to local_model_dir anymore once this returns and the caller cleans it up
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    await asyncio.to_thread(
+        retry()(api.create_commit),
+        repo_id=model_name,
+        operations=operations,
+        commit_message=f"Upload {repo_name}",
+        token=token,
+    )
+    logger.info(f"Model pushed to Hugging Face Hub: {model_name}")